@@ -3,15 +3,26 @@
 import os
 import random
 import math
-import pandas as pd
-from locust import HttpUser, task, between
+import pyarrow.parquet as pq
+from locust import task, between
+from locust.contrib.fasthttp import FastHttpUser
 
 # --- START: LOAD DATA ONCE ---
 # Load the test data at the module level. This happens only one time when Locust starts.
 print("--- Loading test data ---")
 try:
     PARQUET_PATH = os.path.join(os.path.dirname(__file__), "request.parquet")
-    TEST_DATA = pd.read_parquet(PARQUET_PATH).to_dict("records")
+    REQUEST_COLUMNS = ["user_id", "latitude", "longitude", "size", "max_dis", "sort_dis"]
+    # Drop NaN params and split off the user_id once here, so tasks only pick a prepared request
+    TEST_DATA = []
+    for record in pq.read_table(PARQUET_PATH, columns=REQUEST_COLUMNS).to_pylist():
+        params = {
+            key: value for key, value in record.items()
+            if value is not None and not (isinstance(value, float) and math.isnan(value))
+        }
+        user_id = params.pop("user_id", None)
+        if user_id:
+            TEST_DATA.append((user_id, params))
     print(f"--- Test data loaded: {len(TEST_DATA)} records ---")
 except FileNotFoundError:
     print(f"!!! ERROR: request.parquet not found at {PARQUET_PATH}. Exiting. !!!")
@@ -19,10 +30,13 @@ except FileNotFoundError:
 # --- END: LOAD DATA ONCE ---
 
 
-class RecommendationUser(HttpUser):
+class RecommendationUser(FastHttpUser):
     # Set a host if not provided on the command line
     host = "http://localhost:8000"
     wait_time = between(0.5, 2.0)
+    # geventhttpclient-based client, so the load generator doesn't become the bottleneck
+    network_timeout = 10.0
+    connection_timeout = 2.0
     
     # The on_start method is now removed, as it's no longer needed.
 
@@ -36,19 +50,9 @@ class RecommendationUser(HttpUser):
             self.environment.runner.quit()
             return
 
-        # Use the globally loaded TEST_DATA
-        params = random.choice(TEST_DATA).copy()
-        
-        # Clean NaN values from the chosen parameters
-        params_to_send = {}
-        for key, value in params.items():
-            if not (isinstance(value, float) and math.isnan(value)):
-                params_to_send[key] = value
-        
-        user_id = params_to_send.pop("user_id", None)
-        if not user_id:
-            return
+        # Use the globally loaded, pre-cleaned TEST_DATA
+        user_id, params = random.choice(TEST_DATA)
 
         url = f"/recommend/{user_id}"
         
-        self.client.get(url, params=params_to_send, name="/recommend/[user_id]")
\ No newline at end of file
+        self.client.get(url, params=params, name="/recommend/[user_id]")
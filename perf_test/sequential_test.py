@@ -1,15 +1,17 @@
 # sequential_test.py
 
+import math
 import os
 from time import time
 
 import numpy as np
-import pandas as pd
+import pyarrow.parquet as pq
 import requests
 from tqdm import tqdm
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(CURRENT_DIR, "") # Assuming request.parquet is in perf_test
+REQUEST_COLUMNS = ["user_id", "latitude", "longitude", "size", "max_dis", "sort_dis"]
 
 
 def test_perf(reqs: list) -> tuple[float, list[float], int]:
@@ -17,47 +19,43 @@ def test_perf(reqs: list) -> tuple[float, list[float], int]:
     total_time = 0
     time_all = []
     failed_requests = 0
-    for req in tqdm(reqs, desc="Sending Requests"):
-        req_copy = req.copy()
-        user_id = req_copy.pop("user_id")
-
-        try:
-            s = time()
-            # IMPORTANT: Ensure this port matches your docker-compose.yml (e.g., 8000)
-            response = requests.get(f"http://127.0.0.1:8000/recommend/{user_id}", params=req_copy, timeout=10)
-            time_use = (time() - s) * 1000  # Convert to ms
-
-            if response.status_code == 200:
-                total_time += time_use
-                time_all.append(time_use)
-            else:
+    # Reuse one keep-alive connection so latencies don't include a TCP handshake per request
+    with requests.Session() as session:
+        for req in tqdm(reqs, desc="Sending Requests"):
+            req_copy = req.copy()
+            user_id = req_copy.pop("user_id")
+
+            try:
+                s = time()
+                # IMPORTANT: Ensure this port matches your docker-compose.yml (e.g., 8000)
+                response = session.get(f"http://127.0.0.1:8000/recommend/{user_id}", params=req_copy, timeout=10)
+                time_use = (time() - s) * 1000  # Convert to ms
+
+                if response.status_code == 200:
+                    total_time += time_use
+                    time_all.append(time_use)
+                else:
+                    failed_requests += 1
+                    print(f"Request failed for user {user_id} with status {response.status_code}: {response.text[:100]}")
+
+            except requests.exceptions.RequestException as e:
                 failed_requests += 1
-                print(f"Request failed for user {user_id} with status {response.status_code}: {response.text[:100]}")
-
-        except requests.exceptions.RequestException as e:
-            failed_requests += 1
-            print(f"Request failed for user {user_id} with exception: {e}")
+                print(f"Request failed for user {user_id} with exception: {e}")
 
 
     return total_time, time_all, failed_requests
 
 
 def load_request() -> list:
-    """Load request data from parquet file"""
-    df = pd.read_parquet(os.path.join(DATA_DIR, "request.parquet"))
-    reqs = df.to_dict(orient="records")
+    """Load request data from parquet file, dropping params that are nan"""
+    table = pq.read_table(os.path.join(DATA_DIR, "request.parquet"), columns=REQUEST_COLUMNS)
+    reqs = [
+        {k: v for k, v in r.items() if v is not None and not (isinstance(v, float) and math.isnan(v))}
+        for r in table.to_pylist()
+    ]
     return reqs
 
 
-def process_request(reqs: list):
-    """Pop sort_dis and max_dis if it is nan"""
-    for req in reqs:
-        if pd.isna(req.get("sort_dis")):
-            req.pop("sort_dis", None)
-        if pd.isna(req.get("max_dis")):
-            req.pop("max_dis", None)
-
-
 def print_result(req_size: int, total_time: float, time_all: list[float], failed_count: int):
     """Print result of the test"""
     successful_requests = len(time_all)
@@ -85,7 +83,6 @@ def print_result(req_size: int, total_time: float, time_all: list[float], failed
 if __name__ == "__main__":
     reqs = load_request()
     req_size = len(reqs)
-    process_request(reqs)
 
     total_time, time_all, failed_count = test_perf(reqs)
     print_result(req_size, total_time, time_all, failed_count)
\ No newline at end of file
@@ -0,0 +1,46 @@
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import NearestNeighbors
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "model")
+MODEL_PATH = os.path.join(MODEL_DIR, "model.pkl")
+FLOAT32_MODEL_PATH = os.path.join(MODEL_DIR, "model.f32.pkl")
+
+def convert_model_to_float32(model: NearestNeighbors) -> NearestNeighbors:
+    """Refit a NearestNeighbors model on a float32 copy of its fitted samples.
+
+    The training data is not part of this repo, so the samples are read back from the
+    fitted model itself. That relies on scikit-learn's private `_fit_X`, which is why this
+    runs once, offline, against the versions pinned in requirements.txt, and its output
+    is committed rather than regenerated at build or boot time.
+
+    Args:
+        model (NearestNeighbors): The float64-fitted model.
+
+    Returns:
+        NearestNeighbors: A new model with the same parameters, fitted on float32 samples.
+    """
+    fit_samples = getattr(model, "_fit_X", None)
+    if fit_samples is None:
+        raise ValueError("Model has no fitted samples (_fit_X); check the scikit-learn version.")
+    samples = np.asarray(fit_samples, dtype=np.float32)
+    # Fit on a DataFrame so the converted model keeps feature_names_in_
+    columns = getattr(model, "feature_names_in_", None)
+    if columns is not None:
+        samples = pd.DataFrame(samples, columns=columns)
+    return NearestNeighbors(**model.get_params()).fit(samples)
+
+if __name__ == "__main__":
+
+    # Load the original float64-fitted model
+    model = joblib.load(MODEL_PATH)
+
+    # Refit on float32 samples
+    print("Converting model samples to float32...")
+    converted = convert_model_to_float32(model)
+
+    # Write next to the original, which is left untouched
+    joblib.dump(converted, FLOAT32_MODEL_PATH)
+    print(f"Saved float32 model to {FLOAT32_MODEL_PATH}")
@@ -1,9 +1,11 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, LargeBinary
 from sqlalchemy.engine import Engine
+import numpy as np
 import pandas as pd
 import os
 from dotenv import load_dotenv
-import h3
+# The integer API returns H3 cells as 64-bit ints, matching the BIGINT column
+from h3.api import basic_int as h3
 
 load_dotenv()
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
@@ -31,10 +33,11 @@ def read_data() -> tuple[pd.DataFrame, pd.DataFrame]:
     restaurant_df['longitude'] = pd.to_numeric(restaurant_df['longitude'], errors='coerce')
     restaurant_df.dropna(subset=['latitude', 'longitude'], inplace=True)
     print("Calculating H3 indexes for restaurants...")
-    restaurant_df['h3_index'] = restaurant_df.apply(
-        lambda row: h3.latlng_to_cell(row['latitude'], row['longitude'], 9),
-        axis=1
-    )
+    # Zip over plain Python floats instead of apply(axis=1), which builds a Series per row
+    restaurant_df['h3_index'] = [
+        h3.latlng_to_cell(lat, lng, 9)
+        for lat, lng in zip(restaurant_df['latitude'].tolist(), restaurant_df['longitude'].tolist())
+    ]
     return user_df, restaurant_df
 
 def create_tables(engine: Engine, reset: bool = True):
@@ -60,21 +63,19 @@ def create_tables(engine: Engine, reset: bool = True):
                 "index" INTEGER,
                 latitude DOUBLE PRECISION,
                 longitude DOUBLE PRECISION,
-                h3_index TEXT
+                h3_index BIGINT
             );
             CREATE INDEX idx_restaurants_h3 ON restaurants(h3_index);
         """))
         
         # Create users table
-        # Dynamically create feature columns based on a sample
-        feature_columns = [f'feature_{i} DOUBLE PRECISION' for i in range(1000)]
-        create_users_table_sql = f"""
+        # The 1000 features are packed into a single float32 blob
+        connection.execute(text("""
             CREATE TABLE users (
                 user_id TEXT PRIMARY KEY,
-                {', '.join(feature_columns)}
+                features BYTEA NOT NULL
             );
-        """
-        connection.execute(text(create_users_table_sql))
+        """))
 
         print("Creating database indexes...")        
 
@@ -98,7 +99,17 @@ def insert_data(user_df: pd.DataFrame, restaurant_df: pd.DataFrame, engine: Engi
     restaurant_df.to_sql("restaurants", engine, if_exists="append", index=False)
     
     print("Inserting user data to database...")
-    user_df.to_sql("users", engine, if_exists="append", index=False, chunksize=1000) # Use chunksize for large data
+    # Pack in the exact order the model was fitted on (feature_names_in_)
+    feature_cols = [f"feature_{i}" for i in range(1000)]
+    features = user_df[feature_cols].to_numpy(np.float32)
+    packed_df = pd.DataFrame({
+        "user_id": user_df["user_id"],
+        "features": [row.tobytes() for row in features],
+    })
+    packed_df.to_sql(
+        "users", engine, if_exists="append", index=False, chunksize=1000, # Use chunksize for large data
+        dtype={"features": LargeBinary}
+    )
     
     print("Data insertion complete.")
 
@@ -1,9 +1,11 @@
 # In server/database.py
 import os
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Float, Index
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, BigInteger, String, Float, LargeBinary, Index
+import asyncpg
+import numpy as np
 
-def get_database_engine():
-    """Creates and returns a SQLAlchemy engine for PostgreSQL."""
+def get_database_url(driver: str | None = None) -> str:
+    """Builds the PostgreSQL URL from environment variables, optionally for a SQLAlchemy driver."""
     db_user = os.getenv("POSTGRES_USER")
     db_password = os.getenv("POSTGRES_PASSWORD")
     db_host = os.getenv("POSTGRES_HOST")
@@ -13,12 +15,25 @@ def get_database_engine():
     if not all([db_user, db_password, db_host, db_name]):
         raise ValueError("Database environment variables are not set.")
 
+    scheme = f"postgresql+{driver}" if driver else "postgresql"
+    return f"{scheme}://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+
+def get_database_engine():
+    """Creates and returns a SQLAlchemy engine for PostgreSQL."""
     # This URL configures the connection pool.
     # pool_size=10, max_overflow=5 are good starting points.
-    db_url = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-    engine = create_engine(db_url, pool_size=10, max_overflow=5)
+    engine = create_engine(get_database_url("psycopg2"), pool_size=10, max_overflow=5)
     return engine
 
+async def create_pg_pool() -> asyncpg.Pool:
+    """Creates the asyncpg connection pool used by the API request handlers."""
+    # The pool is per worker and only serves cache misses, so keep it small:
+    # workers x max_size must stay under PostgreSQL's max_connections (100 by default)
+    min_size = int(os.getenv("POSTGRES_POOL_MIN_SIZE", "1"))
+    max_size = int(os.getenv("POSTGRES_POOL_MAX_SIZE", "5"))
+    return await asyncpg.create_pool(get_database_url(), min_size=min_size, max_size=max_size)
+
+# The SQLAlchemy engine is used by the gunicorn pre-warm hook
 engine = get_database_engine()
 metadata = MetaData()
 
@@ -26,14 +41,66 @@ metadata = MetaData()
 # This allows us to build queries without writing raw SQL strings
 users_table = Table('users', metadata,
     Column('user_id', String, primary_key=True),
-    *[Column(f'feature_{i}', Float) for i in range(1000)]
+    Column('features', LargeBinary)  # 1000 float32 values as raw bytes
 )
 
+def features_cache_key(user_id: str) -> str:
+    """Redis key for a user's features, namespaced by value format so entries
+    written in an older format (e.g. pickled float64 arrays) are never decoded as float32."""
+    return f"f32:{user_id}"
+
 # Define the 'restaurants' table
 restaurants_table = Table('restaurants', metadata,
     Column('restaurant_id', String, primary_key=True),
     Column('index', Integer, index=True),
     Column('latitude', Float),
     Column('longitude', Float),
-    Column('h3_index', String, index=True)
-)
\ No newline at end of file
+    Column('h3_index', BigInteger, index=True)
+)
+
+# Hot-path queries for the asyncpg pool. asyncpg prepares each statement once
+# per connection and reuses it from its statement cache on later calls.
+USER_FEATURES_SQL = "SELECT features FROM users WHERE user_id = $1"
+# Rows without an index or H3 cell can never match a request, and indices outside
+# [0, $1) can never be returned by the model, so they are skipped at load
+RESTAURANTS_SQL = (
+    'SELECT restaurant_id, "index", latitude, longitude, h3_index FROM restaurants '
+    'WHERE "index" IS NOT NULL AND h3_index IS NOT NULL AND "index" >= 0 AND "index" < $1'
+)
+
+async def load_restaurant_table(pool: asyncpg.Pool, size: int) -> dict[str, np.ndarray]:
+    """Loads the whole restaurants table into NumPy arrays addressed by the model's restaurant index.
+
+    Args:
+        pool (asyncpg.Pool): The asyncpg connection pool.
+        size (int): Number of samples the model was fitted on, i.e. the length of every array.
+
+    Returns:
+        dict[str, np.ndarray]: `restaurant_id`, `latitude`, `longitude` and `h3_index` columns, plus a
+        `present` mask that is False for indices with no row in the table.
+    """
+    async with pool.acquire() as connection:
+        rows = await connection.fetch(RESTAURANTS_SQL, size)
+
+    # Records are read positionally in RESTAURANTS_SQL column order and packed
+    # straight into contiguous arrays with np.fromiter, one pass per column
+    count = len(rows)
+    positions = np.fromiter((row[1] for row in rows), dtype=np.int64, count=count)
+    table = {
+        "restaurant_id": np.empty(size, dtype=object),
+        "latitude": np.full(size, np.nan),
+        "longitude": np.full(size, np.nan),
+        "h3_index": np.zeros(size, dtype=np.int64),
+        "present": np.zeros(size, dtype=bool),
+    }
+    table["restaurant_id"][positions] = [row[0] for row in rows]
+    # Missing coordinates become NaN and drop out of the distance filter
+    table["latitude"][positions] = np.fromiter(
+        (np.nan if row[2] is None else row[2] for row in rows), dtype=np.float64, count=count
+    )
+    table["longitude"][positions] = np.fromiter(
+        (np.nan if row[3] is None else row[3] for row in rows), dtype=np.float64, count=count
+    )
+    table["h3_index"][positions] = np.fromiter((row[4] for row in rows), dtype=np.int64, count=count)
+    table["present"][positions] = True
+    return table
@@ -1,34 +1,110 @@
 from contextlib import asynccontextmanager
+from functools import lru_cache
+import math
 from fastapi import FastAPI, Query, HTTPException
-# from fastapi.concurrency import run_in_threadpool
-from sqlalchemy import select
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 import joblib
 import os
 from dotenv import load_dotenv
-from haversine import haversine, Unit
 import pandas as pd
-from .database import engine, users_table, restaurants_table
-import h3
+from .database import create_pg_pool, load_restaurant_table, features_cache_key, USER_FEATURES_SQL
+from h3.api import basic_int as h3
 import time
 import numpy as np
+from numba import njit
 import warnings
 import redis
-import pickle
+import redis.asyncio as aioredis
 
 load_dotenv()
 
 warnings.filterwarnings("ignore", category=UserWarning, module="sklearn")
 # --- REDIS CACHE SETUP ---
 
-# Create a Redis client connection. It will connect using the environment variable.
-try:
-    redis_client = redis.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=6379, db=0)
-    # Ping the server to test the connection
-    redis_client.ping()
-    print("--- Connected to Redis successfully ---")
-except redis.exceptions.ConnectionError as e:
-    print(f"--- Could not connect to Redis: {e} ---")
-    redis_client = None
+async def connect_redis() -> aioredis.Redis | None:
+    """Create an asyncio Redis client from the environment, or None if Redis is unreachable."""
+    # Size the pool for the worker's concurrent requests so calls never wait on a connection.
+    # The C hiredis parser is picked up automatically when installed.
+    redis_pool = aioredis.BlockingConnectionPool(
+        host=os.getenv("REDIS_HOST", "localhost"), port=6379, db=0, max_connections=64, timeout=1
+    )
+    # from_pool hands the pool to the client, so aclose() also disconnects it
+    redis_client = aioredis.Redis.from_pool(redis_pool)
+    try:
+        # Ping the server to test the connection
+        await redis_client.ping()
+        print("--- Connected to Redis successfully ---")
+        return redis_client
+    except redis.exceptions.ConnectionError as e:
+        print(f"--- Could not connect to Redis: {e} ---")
+        await redis_client.aclose()
+        return None
+
+# --- Geo Helpers ---
+
+# Mean earth radius, the same value the haversine package uses
+EARTH_RADIUS_METERS = 6371008.8
+# No two points are further apart than half the earth's circumference
+MAX_DISPLACEMENT_METERS = 20_037_509
+
+# fastmath without the no-NaN/no-inf assumptions: NaN coordinates must still fail the distance check
+@njit(cache=True, fastmath={"nsz", "arcp", "contract", "afn", "reassoc"})
+def top_k_haversine(
+    lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray, diffs: np.ndarray,
+    max_dis: float, k: int, sort_by_dis: bool
+) -> tuple[np.ndarray, np.ndarray]:
+    """Fused haversine filter and top-k over candidate restaurants, in a single pass.
+
+    Returns the positions of at most `k` candidates within `max_dis` meters, ordered by
+    displacement when `sort_by_dis` is set and by model difference otherwise, together
+    with their displacements rounded to whole meters (as int64).
+    """
+    n_candidates = lats.shape[0]
+    k = min(k, n_candidates)
+    top_positions = np.empty(k, dtype=np.int64)
+    top_keys = np.empty(k, dtype=np.float64)
+    top_displacements = np.empty(k, dtype=np.int64)
+    n = 0
+    lat_rad = math.radians(lat)
+    cos_lat = math.cos(lat_rad)
+    for i in range(n_candidates):
+        lat_i = math.radians(lats[i])
+        sin_dlat = math.sin((lat_i - lat_rad) / 2)
+        sin_dlng = math.sin(math.radians(lngs[i] - lng) / 2)
+        a = sin_dlat * sin_dlat + cos_lat * math.cos(lat_i) * sin_dlng * sin_dlng
+        displacement = np.rint(2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a)))
+        if not displacement <= max_dis:
+            continue
+        key = displacement if sort_by_dis else diffs[i]
+        if n == k:
+            if k == 0 or key >= top_keys[k - 1]:
+                continue
+            j = k - 1
+        else:
+            j = n
+            n += 1
+        # Insertion into the sorted buffer; equal keys keep candidate order
+        while j > 0 and top_keys[j - 1] > key:
+            top_positions[j] = top_positions[j - 1]
+            top_keys[j] = top_keys[j - 1]
+            top_displacements[j] = top_displacements[j - 1]
+            j -= 1
+        top_positions[j] = i
+        top_keys[j] = key
+        top_displacements[j] = np.int64(displacement)
+    return top_positions[:n], top_displacements[:n]
+
+@lru_cache(maxsize=100_000)
+def search_area_cells(cell: int) -> np.ndarray:
+    """H3 cells within 4 rings of `cell`, memoized since users cluster in a few hot cells.
+
+    Returned as a read-only int64 array so it can be matched against the restaurant
+    h3_index column directly, without converting a Python sequence on every request.
+    """
+    cells = np.fromiter(h3.grid_disk(cell, 4), dtype=np.int64)
+    cells.setflags(write=False)
+    return cells
 
 # --- Model Loading ---
 
@@ -36,29 +112,47 @@ except redis.exceptions.ConnectionError as e:
 async def lifespan(app: FastAPI):
     """
     Manages application startup and shutdown events.
-    Loads the ML model on startup and cleans up on shutdown.
+    Loads the ML model and the restaurant table on startup and cleans up on shutdown.
     """
     # Startup: Load the model
     print("--- Loading ML model ---")
     
     # automatically pick up the MODEL_PATH from .env (in case not running on docker)
-    model_path = os.getenv("MODEL_PATH", "/app/model/model.pkl") 
+    model_path = os.getenv("MODEL_PATH", "/app/model/model.f32.pkl") 
     
-    # The model.pkl is the binary of the Scikit-Learn NearestNeighbors object
-    app.state.model = joblib.load(model_path) 
+    # The model.f32.pkl is the binary of the Scikit-Learn NearestNeighbors object,
+    # refit on float32 samples from model.pkl by scripts/convert_model.py
+    app.state.model = joblib.load(model_path)
     print("--- Model loaded successfully ---")
+
+    app.state.redis = await connect_redis()
+    app.state.pg = await create_pg_pool()
+
+    # Compile (or load from cache) the displacement kernel before the first request needs it
+    empty = np.empty(0, dtype=np.float64)
+    top_k_haversine(0.0, 0.0, empty, empty, empty, 0.0, 1, False)
+
+    # Restaurant data is small and static, so keep it in memory instead of querying per request
+    print("--- Loading restaurant table ---")
+    app.state.restaurants = await load_restaurant_table(app.state.pg, app.state.model.n_samples_fit_)
+    print(f"--- Restaurant table loaded: {int(app.state.restaurants['present'].sum())} restaurants ---")
     
     yield  # The application runs while the lifespan context is active
 
     # Shutdown: Clean up resources
     print("--- Cleaning up resources ---")
     app.state.model = None
+    app.state.restaurants = None
+    if app.state.redis:
+        await app.state.redis.aclose()
+    await app.state.pg.close()
 
 # --- App Initialization ---
 
 # Register the lifespan manager with the FastAPI app
 app = FastAPI(
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,  # orjson encodes the result lists much faster than stdlib json
     title="Restaurant Recommendation API",
     description="API for serving restaurant recommendations using a Scikit-Learn model.",
     version="1.0.0"
@@ -73,7 +167,7 @@ def read_root():
 # Define the endpoint for recommendations
 @app.get("/recommend/{user_id}")
 @app.post("/recommend/{user_id}")
-def get_recommendations(
+async def get_recommendations(
     user_id: str,
     latitude: float,
     longitude: float,
@@ -81,72 +175,76 @@ def get_recommendations(
     max_dis: int = Query(5000, gt=0),
     sort_dis: int = Query(0, ge=0, le=1)
 ):
+    # The search area only depends on the request, so resolve it up front
+    user_h3_index = h3.latlng_to_cell(latitude, longitude, 9)
+    search_area_h3_indices = search_area_cells(user_h3_index)
+    if not len(search_area_h3_indices):
+        return {"restaurants": []}
+
     # --- Get User Features (with Lazy-Loading Cache) ---
     features = None
+    redis_client = app.state.redis
     if redis_client:
-        cached_features = redis_client.get(user_id)
+        cached_features = await redis_client.get(features_cache_key(user_id))
     else:
         cached_features = None
 
     if cached_features:
         print(f"DEBUG: Cache HIT for user_id: {user_id}")
-        features = pickle.loads(cached_features)
+        features = np.frombuffer(cached_features, dtype=np.float32).reshape(1, -1)
     else:
         print(f"DEBUG: Cache MISS for user_id: {user_id}")
-        with engine.connect() as connection:
-            query = select(users_table.c.feature_0, *[users_table.c[f'feature_{i}'] for i in range(1, 1000)]).where(users_table.c.user_id == user_id)
-            user_data = connection.execute(query).first()
+        async with app.state.pg.acquire() as connection:
+            user_data = await connection.fetchrow(USER_FEATURES_SQL, user_id)
         
         if not user_data:
             raise HTTPException(status_code=404, detail="User not found")
 
-        features = np.array([user_data]).reshape(1, -1)
+        features = np.frombuffer(user_data[0], dtype=np.float32).reshape(1, -1)
         if redis_client:
-            redis_client.set(user_id, pickle.dumps(features), ex=3600)
+            # The column already holds the float32 bytes, so cache them as-is
+            await redis_client.set(features_cache_key(user_id), user_data[0], ex=3600)
 
     # --- Run Model Prediction ---
     n_neighbors_to_query = 200
-    distances, indices = app.state.model.kneighbors(features, n_neighbors=n_neighbors_to_query)
-    model_indices_list = [int(i) for i in indices[0]]
-    if not model_indices_list:
+    # kneighbors is CPU-bound; run it off the event loop so other requests keep being served
+    distances, indices = await run_in_threadpool(
+        app.state.model.kneighbors, features, n_neighbors=n_neighbors_to_query
+    )
+    model_indices = indices[0]
+    if not len(model_indices):
         return {"restaurants": []}
 
-    # --- Fetch Restaurant Data ---
-    with engine.connect() as connection:
-        user_h3_index = h3.latlng_to_cell(latitude, longitude, 9)
-        search_area_h3_indices = list(h3.grid_disk(user_h3_index, k=4))
-        if not search_area_h3_indices:
-            return {"restaurants": []}
-
-        query = select(restaurants_table).where(
-            restaurants_table.c.index.in_(model_indices_list),
-            restaurants_table.c.h3_index.in_(search_area_h3_indices)
-        )
-        restaurant_results = [row._asdict() for row in connection.execute(query).fetchall()]
-    
-    if not restaurant_results:
+    # --- Look Up Restaurant Data ---
+    restaurants = app.state.restaurants
+    positions = np.flatnonzero(model_indices < len(restaurants["present"]))
+    candidate_indices = model_indices[positions]
+    in_search_area = restaurants["present"][candidate_indices] & np.isin(
+        restaurants["h3_index"][candidate_indices], search_area_h3_indices
+    )
+    positions, candidate_indices = positions[in_search_area], candidate_indices[in_search_area]
+
+    if not len(positions):
         return {"restaurants": []}
     
     # --- Final Processing ---
-    restaurant_map_by_index = {r['index']: r for r in restaurant_results}
-    user_coords = (latitude, longitude)
-    results = []
-    model_distances = distances[0]
-    for i, model_index in enumerate(model_indices_list):
-        restaurant_data = restaurant_map_by_index.get(model_index)
-        if not restaurant_data: continue
-        try:
-            restaurant_coords = (float(restaurant_data['latitude']), float(restaurant_data['longitude']))
-        except (ValueError, TypeError, KeyError): continue
-        displacement_meters = haversine(user_coords, restaurant_coords, unit=Unit.METERS)
-        results.append({"id": restaurant_data['restaurant_id'], "difference": model_distances[i], "displacement": round(displacement_meters)})
+    restaurant_ids = restaurants["restaurant_id"][candidate_indices]
+    lats = restaurants["latitude"][candidate_indices]
+    lons = restaurants["longitude"][candidate_indices]
+    differences = distances[0][positions].astype(np.float64, copy=False)
 
     # --- Filtering and Sorting ---
-    filtered_results = [r for r in results if r['displacement'] <= int(max_dis)]
-    if int(sort_dis) == 1:
-        sorted_results = sorted(filtered_results, key=lambda r: r['displacement'])
-    else:
-        sorted_results = sorted(filtered_results, key=lambda r: r['difference'])
-
-    final_results = sorted_results[:int(size)]
-    return {"restaurants": final_results}
\ No newline at end of file
+    # Clamp size and max_dis so huge values still fit the kernel's int64/float64 arguments
+    k = min(int(size), len(positions))
+    max_displacement = float(min(int(max_dis), MAX_DISPLACEMENT_METERS))
+    top_positions, top_displacements = top_k_haversine(
+        latitude, longitude, lats, lons, differences, max_displacement, k, int(sort_dis) == 1
+    )
+
+    # Returning the response directly skips jsonable_encoder; orjson serializes the
+    # NumPy scalars itself (ORJSONResponse enables OPT_SERIALIZE_NUMPY)
+    final_results = [
+        {"id": restaurant_ids[j], "difference": differences[j], "displacement": displacement}
+        for j, displacement in zip(top_positions, top_displacements)
+    ]
+    return ORJSONResponse({"restaurants": final_results})
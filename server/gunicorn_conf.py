@@ -1,12 +1,21 @@
 import os
-import pickle
-import numpy as np
 import redis
 from sqlalchemy import select
 
 # Import your database engine and table definitions
 # Make sure your database.py can be imported like this
-from app.database import engine, users_table
+from app.database import engine, users_table, features_cache_key
+
+# --- Server Settings ---
+
+# Async Uvicorn workers multiplex many in-flight requests per process.
+# WEB_CONCURRENCY sets the worker count (docker-compose.yml pins it to 8);
+# (2 x CPU) + 1 is only the fallback when it is unset.
+workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 2) * 2 + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Import the app once in the master so workers fork with its modules already loaded
+preload_app = True
+keepalive = 30
 
 def on_starting(server):
     """
@@ -27,20 +36,19 @@ def on_starting(server):
     try:
         print("--- GUNICORN MASTER: Pre-loading user features into Redis cache... ---")
         with engine.connect() as connection:
-            query = select(users_table)
+            query = select(users_table.c.user_id, users_table.c.features)
             result_proxy = connection.execute(query)
             
             total_loaded_count = 0
             while True:
-                batch = result_proxy.fetchmany(5000)
+                batch = result_proxy.fetchmany(20_000)
                 if not batch:
                     break
 
                 with redis_client.pipeline() as pipe:
+                    # The features column already holds the float32 bytes the cache expects
                     for user in batch:
-                        user_id = user.user_id
-                        features = np.array(user[1:]).reshape(1, -1)
-                        pipe.set(user_id, pickle.dumps(features), ex=3600)
+                        pipe.set(features_cache_key(user.user_id), user.features, ex=3600)
                     pipe.execute()
                 
                 total_loaded_count += len(batch)